@@ -5,13 +5,23 @@ Focuses on dry bulk shipping and general maritime news for sentiment analysis
 """
 
 import os
-import json
-import requests
-import pandas as pd
+import csv
+import shutil
+import asyncio
+import aiohttp
+import orjson
+from pybloom_live import ScalableBloomFilter
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
+from collections import Counter
 import hashlib
+import re
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -106,18 +116,111 @@ class MaritimeNewsScraper:
             "Baltic Forward Assessments"
         ]
         
-        # Relevant sources for maritime news - industry publications
-        self.sources = [
-            "tradewinds",
-            "lloyds-list"
+        # Single alternation over whole-word keywords, longest first so overlapping
+        # keywords match the most specific phrase. Each keyword gets its own group,
+        # so a match maps back to the keyword via its group index.
+        self._kw_order = sorted(self.keywords, key=len, reverse=True)
+        self._kw_re = re.compile(
+            r'\b(?:' + '|'.join(f'({re.escape(k)})' for k in self._kw_order) + r')\b',
+            re.IGNORECASE
+        )
+
+        # Maximum number of NewsAPI requests in flight at once
+        self.max_concurrency = 10
+        
+        # Transient NewsAPI failures are retried with exponential backoff
+        self.max_retries = 5
+        self.retry_backoff = 1.0
+        self.retry_statuses = {429, 500, 502, 503, 504}
+        # A longer Retry-After (e.g. daily quota exhausted) is not worth waiting for
+        self.max_retry_after = 60
+        
+        # Per-day Bloom filters of article IDs already saved, persisted between runs.
+        # seen_ids holds today's filter; seen_history the earlier days still in the window.
+        self.seen_ids_dir = self.data_dir / ".seen_ids"
+        self.seen_ids = None
+        self.seen_history = []
+        self._seen_day = None
+        
+        # Shared by every article processed in a run
+        self._scrape_ts = None
+        
+        # Articles are streamed to this NDJSON file as they are accepted
+        self.ndjson_file = None
+        
+        # Column order of the CSV output, matching the keys built in process_article
+        self.csv_fields = [
+            'article_id', 'title', 'link', 'creator', 'pubdate', 'category',
+            'description', 'source', 'country', 'article_type', 'scrape_timestamp'
         ]
 
+    def _pack_queries(self, keywords, max_len=450, max_keywords=4):
+        """Greedily pack quoted keywords into (OR query, batch keywords) pairs of bounded size"""
+        # Every query shares a single pageSize of results, so batches are kept small
+        # enough that a batch rarely matches more articles than one page can return
+        packed = []
+        current = ''
+        batch = []
+        for keyword in keywords:
+            term = f'"{keyword}"'
+            candidate = f"{current} OR {term}" if current else term
+            if current and (len(candidate) > max_len or len(batch) == max_keywords):
+                packed.append((current, batch))
+                current = term
+                batch = [keyword]
+            else:
+                current = candidate
+                batch.append(keyword)
+        if current:
+            packed.append((current, batch))
+        return packed
+
     def create_article_id(self, article):
         """Create unique ID for article based on title and URL"""
         title = article.get('title') or ''
         url = article.get('url') or ''
         content = f"{title}{url}"
-        return hashlib.md5(content.encode('utf-8')).hexdigest()
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def load_seen_ids(self, today, retention_days):
+        """Load the per-day Bloom filters of saved article IDs, pruning expired days"""
+        self.seen_ids_dir.mkdir(exist_ok=True)
+        oldest = today - timedelta(days=retention_days)
+        
+        self._seen_day = today
+        self.seen_ids = None
+        self.seen_history = []
+        
+        for path in sorted(self.seen_ids_dir.glob('*.bloom')):
+            day = datetime.strptime(path.stem, '%Y-%m-%d').date()
+            if day < oldest:
+                path.unlink()
+                continue
+            
+            with open(path, 'rb') as f:
+                bloom = ScalableBloomFilter.fromfile(f)
+            if day == today:
+                self.seen_ids = bloom
+            else:
+                self.seen_history.append(bloom)
+        
+        if self.seen_ids is None:
+            self.seen_ids = ScalableBloomFilter(initial_capacity=10_000, error_rate=1e-6)
+        
+        logger.info(f"Loaded seen article IDs for {len(self.seen_history) + 1} day(s) since {oldest}")
+
+    def is_seen(self, article_id):
+        """Check whether an article was saved by this or an earlier run in the window"""
+        return article_id in self.seen_ids or any(article_id in bloom for bloom in self.seen_history)
+
+    def save_seen_ids(self):
+        """Persist today's Bloom filter of saved article IDs for the next run"""
+        with open(self.seen_ids_dir / f"{self._seen_day}.bloom", 'wb') as f:
+            self.seen_ids.tofile(f)
+
+    def _categorize(self, text):
+        """Return the keywords that appear in text, in canonical spelling"""
+        return sorted({self._kw_order[m.lastindex - 1] for m in self._kw_re.finditer(text)})
 
     def determine_country(self, article):
         """Determine geographic focus from article content"""
@@ -190,24 +293,28 @@ class MaritimeNewsScraper:
             else:
                 return 'News'
 
-    def process_article(self, article, keyword):
+    def process_article(self, article, batch_keywords=()):
         """Process article to match RSS feed structure"""
+        # NewsAPI also matches on content, so fall back to the query's keywords
+        # when none of them appear in the text NewsAPI returns
+        text = ' '.join(article.get(field) or '' for field in ('title', 'description', 'content'))
+        categories = self._categorize(text) or batch_keywords
         processed = {
             'article_id': self.create_article_id(article),
             'title': article.get('title') or '',
             'link': article.get('url') or '',
             'creator': article.get('author') or '',
             'pubdate': article.get('publishedAt') or '',
-            'category': keyword,
+            'category': ','.join(categories),
             'description': article.get('description') or '',
             'source': (article.get('source') or {}).get('name') or '',
             'country': self.determine_country(article),
             'article_type': self.determine_article_type(article),
-            'scrape_timestamp': datetime.utcnow().isoformat() + 'Z'
+            'scrape_timestamp': self._scrape_ts
         }
         return processed
 
-    def fetch_news(self, query, from_date, to_date, page_size=100):
+    async def fetch_news(self, session, query, from_date, to_date, page_size=100):
         """Fetch news articles from NewsAPI"""
         params = {
             'q': query,
@@ -219,13 +326,57 @@ class MaritimeNewsScraper:
             'language': 'en'
         }
         
-        try:
-            response = requests.get(f"{self.base_url}/everything", params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            logger.error(f"Error fetching news for query '{query}': {e}")
-            return None
+        for attempt in range(self.max_retries + 1):
+            delay = self.retry_backoff * 2 ** attempt
+            try:
+                async with session.get(f"{self.base_url}/everything", params=params) as response:
+                    if response.status < 400:
+                        return await response.json(loads=orjson.loads)
+                    
+                    if response.status not in self.retry_statuses:
+                        logger.warning(f"NewsAPI returned {response.status} for query '{query}': {await response.text()}")
+                        return None
+                    
+                    if attempt == self.max_retries:
+                        logger.error(f"NewsAPI returned {response.status} for query '{query}' after {attempt + 1} attempts")
+                        return None
+                    
+                    # Honour the server's throttling hint when it gives one in seconds
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        if int(retry_after) > self.max_retry_after:
+                            logger.warning(f"NewsAPI returned {response.status} for query '{query}' "
+                                           f"with Retry-After {retry_after}s, giving up")
+                            return None
+                        delay = float(retry_after)
+                    logger.warning(f"NewsAPI returned {response.status} for query '{query}', retrying in {delay:.1f}s")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Error fetching news for query '{query}': {e}")
+                    return None
+                logger.warning(f"Error fetching news for query '{query}': {e}, retrying in {delay:.1f}s")
+            
+            await asyncio.sleep(delay)
+
+    async def _run(self, queries, from_date, to_date):
+        """Fetch all queries concurrently over a single pooled session"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(
+            limit=20,
+            limit_per_host=self.max_concurrency,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+            enable_cleanup_closed=True
+        )
+        timeout = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+        
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def bounded_fetch(query):
+                async with semaphore:
+                    return await self.fetch_news(session, query, from_date, to_date)
+            
+            tasks = [bounded_fetch(query) for query, _ in queries]
+            return await asyncio.gather(*tasks, return_exceptions=True)
 
     def scrape_all_keywords(self, days_back=7):
         """Scrape news for all maritime keywords"""
@@ -234,78 +385,92 @@ class MaritimeNewsScraper:
         
         from_date = start_date.strftime('%Y-%m-%d')
         to_date = end_date.strftime('%Y-%m-%d')
+        self._scrape_ts = end_date.isoformat(timespec='seconds') + 'Z'
+        self.ndjson_file = self.data_dir / f"maritime_news_{end_date.strftime('%Y%m%d_%H%M%S')}.ndjson"
         
         all_articles = []
-        seen_ids = set()
+        self.load_seen_ids(end_date.date(), days_back)
         
         logger.info(f"Scraping maritime news from {from_date} to {to_date} (UTC)")
         
-        for keyword in self.keywords:
-            logger.info(f"Fetching news for: {keyword}")
-            
-            # Try general search first
-            news_data = self.fetch_news(keyword, from_date, to_date)
-            
-            if news_data and news_data.get('articles'):
-                articles = news_data['articles']
-                for article in articles:
-                    processed = self.process_article(article, keyword)
+        # One general search per keyword batch; it already covers the industry publications
+        queries = self._pack_queries(self.keywords)
+        
+        logger.info(f"Fetching {len(queries)} queries with concurrency {self.max_concurrency}")
+        run = uvloop.run if uvloop else asyncio.run
+        results = run(self._run(queries, from_date, to_date))
+        
+        with open(self.ndjson_file, 'wb') as ndjson:
+            for index, ((query, batch_keywords), news_data) in enumerate(zip(queries, results), 1):
+                if isinstance(news_data, Exception):
+                    logger.error(f"Error fetching news for query '{query}': {news_data}")
+                    continue
+                
+                if not (news_data and news_data.get('articles')):
+                    continue
+                
+                total_results = news_data.get('totalResults') or 0
+                if total_results > len(news_data['articles']):
+                    logger.warning(f"Query {index}/{len(queries)} matched {total_results} articles "
+                                   f"but only {len(news_data['articles'])} were returned")
+                
+                new_count = 0
+                for article in news_data['articles']:
+                    processed = self.process_article(article, batch_keywords)
                     article_id = processed['article_id']
                     
                     # Only add if not seen before
-                    if article_id not in seen_ids:
-                        seen_ids.add(article_id)
+                    if not self.is_seen(article_id):
+                        self.seen_ids.add(article_id)
                         all_articles.append(processed)
+                        ndjson.write(orjson.dumps(processed, option=orjson.OPT_APPEND_NEWLINE))
+                        new_count += 1
                 
-                logger.info(f"Found {len([a for a in articles if self.create_article_id(a) not in seen_ids])} unique articles for '{keyword}'")
-            
-            # Also try with specific sources
-            for source in self.sources:
-                source_query = f"{keyword} source:{source}"
-                news_data = self.fetch_news(source_query, from_date, to_date, page_size=50)
-                
-                if news_data and news_data.get('articles'):
-                    articles = news_data['articles']
-                    for article in articles:
-                        processed = self.process_article(article, f"{keyword} (source: {source})")
-                        article_id = processed['article_id']
-                        
-                        # Only add if not seen before
-                        if article_id not in seen_ids:
-                            seen_ids.add(article_id)
-                            all_articles.append(processed)
+                logger.info(f"Found {new_count} unique articles for query {index}/{len(queries)}")
         
         logger.info(f"Total unique articles found: {len(all_articles)}")
         return all_articles
 
+    def write_csv(self, path, articles):
+        """Write articles to a CSV file, header only when there are none"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.csv_fields, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(articles)
+
     def save_data(self, articles):
         """Save scraped data to files"""
+        # Latest files (for consistent filename)
+        latest_json = self.data_dir / "maritime_news_latest.json"
+        latest_csv = self.data_dir / "maritime_news_latest.csv"
+        
         if not articles:
             logger.warning("No articles to save")
+            if self.ndjson_file:
+                self.ndjson_file.unlink(missing_ok=True)
+            
+            # Latest files hold only the newest run's articles, so empty them
+            # rather than leave the previous run's rows to be read again
+            latest_json.write_bytes(b'[]\n')
+            self.write_csv(latest_csv, articles)
             return
         
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-        
-        # Save as JSON
-        json_file = self.data_dir / f"maritime_news_{timestamp}.json"
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(articles, f, indent=2, ensure_ascii=False)
+        # JSON was already streamed to NDJSON during scraping
+        ndjson_file = self.ndjson_file
         
         # Save as CSV for easier analysis
-        df = pd.DataFrame(articles)
-        csv_file = self.data_dir / f"maritime_news_{timestamp}.csv"
-        df.to_csv(csv_file, index=False, encoding='utf-8')
+        csv_file = ndjson_file.with_suffix('.csv')
+        self.write_csv(csv_file, articles)
         
-        # Save latest as well (for consistent filename)
-        latest_json = self.data_dir / "maritime_news_latest.json"
-        latest_csv = self.data_dir / "maritime_news_latest.csv"
+        shutil.copyfile(csv_file, latest_csv)
         
-        with open(latest_json, 'w', encoding='utf-8') as f:
-            json.dump(articles, f, indent=2, ensure_ascii=False)
+        # Existing readers expect the latest articles as a JSON array
+        with open(latest_json, 'wb') as f:
+            f.write(orjson.dumps(articles, option=orjson.OPT_APPEND_NEWLINE))
         
-        df.to_csv(latest_csv, index=False, encoding='utf-8')
+        self.save_seen_ids()
         
-        logger.info(f"Saved {len(articles)} articles to {json_file} and {csv_file}")
+        logger.info(f"Saved {len(articles)} articles to {ndjson_file} and {csv_file}")
         
         # Print summary statistics
         self.print_summary(articles)
@@ -316,12 +481,13 @@ class MaritimeNewsScraper:
         logger.info(f"Total articles: {len(articles)}")
         
         if len(articles) > 0:
-            df = pd.DataFrame(articles)
-            logger.info(f"Date range: {df['pubdate'].min()} to {df['pubdate'].max()}")
-            logger.info(f"Top sources: {df['source'].value_counts().head().to_dict()}")
-            logger.info(f"Top categories: {df['category'].value_counts().head().to_dict()}")
-            logger.info(f"Countries: {df['country'].value_counts().head().to_dict()}")
-            logger.info(f"Article types: {df['article_type'].value_counts().to_dict()}")
+            pubdates = [a['pubdate'] for a in articles if a['pubdate']]
+            if pubdates:
+                logger.info(f"Date range: {min(pubdates)} to {max(pubdates)}")
+            logger.info(f"Top sources: {dict(Counter(a['source'] for a in articles).most_common(5))}")
+            logger.info(f"Top categories: {dict(Counter(a['category'] for a in articles).most_common(5))}")
+            logger.info(f"Countries: {dict(Counter(a['country'] for a in articles).most_common(5))}")
+            logger.info(f"Article types: {dict(Counter(a['article_type'] for a in articles).most_common())}")
             
             # Show UTC scrape timestamp
             logger.info(f"Scraped at: {articles[0]['scrape_timestamp']} (UTC)")